@@ -1,4 +1,9 @@
-import type { Office, StatusRecord, Statuses } from "./interfaces";
+import type {
+  Office,
+  StatusRecord,
+  Statuses,
+  WaitingTimeUpdates,
+} from "./interfaces";
 import { toIsoDate } from "./utils";
 
 const BASE_URL = "https://st-wait-api.codingmarco.de";
@@ -23,6 +28,45 @@ export async function getWaitingTimes(officeId: number, date: Date | string) {
   );
 }
 
+interface CachedSeries {
+  records: StatusRecord[];
+  // Newest snapshot id already contained in records
+  cursor: number;
+}
+
+// Series synced via syncWaitingTimes, keyed by "officeId/date"
+const seriesCache = new Map<string, CachedSeries>();
+
+/**
+ * Fetch only the waiting times added since the last call for this office and
+ * date and append them to the cached series. The first call loads the whole
+ * day. Meant for polling today; closed days are cheaper via getWaitingTimes.
+ */
+export async function syncWaitingTimes(
+  officeId: number,
+  date: Date | string
+): Promise<StatusRecord[]> {
+  const dateString = date instanceof Date ? toIsoDate(date) : date;
+  const key = `${officeId}/${dateString}`;
+  const cached = seriesCache.get(key);
+
+  const updates = await fetchJsonFromApi<WaitingTimeUpdates>(
+    `waiting_time_updates/${officeId}/${dateString}?since_snapshot=${
+      cached?.cursor ?? 0
+    }`
+  );
+  if (cached && updates.waiting_times.length === 0) {
+    cached.cursor = updates.cursor;
+    return cached.records;
+  }
+
+  const records = cached
+    ? cached.records.concat(updates.waiting_times)
+    : updates.waiting_times;
+  seriesCache.set(key, { records, cursor: updates.cursor });
+  return records;
+}
+
 export async function getStatuses(): Promise<Statuses> {
   return fetchJsonFromApi<Statuses>("/statuses");
 }
@@ -12,3 +12,8 @@ export interface StatusRecord {
 export interface Statuses {
   [id: string]: string;
 }
+
+export interface WaitingTimeUpdates {
+  waiting_times: StatusRecord[];
+  cursor: number;
+}
@@ -1,8 +1,9 @@
 import common
+import local_day
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import numpy as np
 import pandas as pd
-import datetime as dt
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 from models import Status, Office, WaitingTime, Snapshot
@@ -81,40 +82,101 @@ def make_legend_interactive(ax, legend):
     print("Hold Shift while clicking to show only that plot and hide all others.")
 
 
-def get_system_timezone():
-    """Get the system's local timezone."""
-    return dt.datetime.now().astimezone().tzinfo
+# Charts start at 6am local time
+DAY_START_MINUTE = 6 * 60
 
 
-def get_today_6am_utc():
-    """Get today's 6am local time converted to UTC."""
-    local_tz = get_system_timezone()
+def to_local_timestamps(timestamps):
+    """Convert naive UTC timestamps to local (Europe/Berlin) time."""
+    return pd.to_datetime(timestamps, utc=True).dt.tz_convert(common.LOCAL_TIMEZONE)
 
-    # Get current local time
-    now_local = dt.datetime.now(local_tz)
 
-    # Create today at 6am local time
-    today_6am_local = now_local.replace(hour=6, minute=0, second=0, microsecond=0)
+def plot_waiting_times(ax, df, status_dict, title, tz=None):
+    """
+    Plot the waiting time status of each office over time.
 
-    # Convert to UTC for database queries
-    today_6am_utc = today_6am_local.astimezone(dt.timezone.utc)
+    Args:
+        ax: matplotlib axis object
+        df: DataFrame with the columns timestamp_local, office and status_id
+        status_dict: dict mapping status ids to their meaning, used as y labels
+        title: chart title
+        tz: timezone of the x-axis labels, None for naive local timestamps
+    """
+    # Get unique offices
+    offices = df["office"].unique()
+
+    # Create a color map for different offices
+    colors = plt.get_cmap("tab10")(np.linspace(0, 1, len(offices)))
+
+    # Plot each office's waiting times
+    for i, office in enumerate(offices):
+        office_data = df[df["office"] == office].copy()
+        office_data = office_data.sort_values("timestamp_local")
+
+        # Convert status to numeric for plotting (use status_id)
+        ax.plot(
+            office_data["timestamp_local"],
+            office_data["status_id"],
+            label=office,
+            color=colors[i],
+            linewidth=1.5,
+            alpha=0.7,
+        )
+
+    # Customize the plot
+    ax.set_xlabel("Time (Local)", fontsize=12)
+    ax.set_ylabel("Waiting Time Status", fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight="bold")
 
-    return today_6am_utc
+    # Format x-axis to show time nicely with local timezone
+    time_span = df["timestamp_local"].max() - df["timestamp_local"].min()
+    if time_span <= pd.Timedelta(days=1):
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M", tz=tz))
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    else:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%a %d.%m. %H:%M", tz=tz))
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator(tz=tz))
 
+    ax.tick_params(axis="x", labelrotation=45)
 
-def convert_utc_to_local(timestamp, local_tz=None):
-    """Convert UTC timestamp to local timezone."""
-    if local_tz is None:
-        local_tz = get_system_timezone()
+    # Set y-axis ticks and labels
+    y_ticks = sorted(status_dict.keys())
+    y_labels = [status_dict[tick] for tick in y_ticks]
+    ax.set_yticks(y_ticks)
+    ax.set_yticklabels(y_labels, fontsize=10)
 
-    # Ensure timestamp is timezone-aware UTC
-    if timestamp.tzinfo is None:
-        timestamp = timestamp.replace(tzinfo=dt.timezone.utc)
-    elif timestamp.tzinfo != dt.timezone.utc:
-        timestamp = timestamp.astimezone(dt.timezone.utc)
+    # Add grid for better readability
+    ax.grid(True, alpha=0.3)
 
-    # Convert to local timezone
-    return timestamp.astimezone(local_tz)
+
+def plot_average_waiting_times(ax, hourly_avg, title):
+    """
+    Plot the average waiting time status of each office by hour of day.
+
+    Args:
+        ax: matplotlib axis object
+        hourly_avg: DataFrame with the columns hour, office and status_id
+        title: chart title
+    """
+    offices = hourly_avg["office"].unique()
+    colors = plt.get_cmap("tab10")(np.linspace(0, 1, len(offices)))
+
+    for i, office in enumerate(offices):
+        office_data = hourly_avg[hourly_avg["office"] == office]
+        ax.plot(
+            office_data["hour"],
+            office_data["status_id"],
+            label=office,
+            color=colors[i],
+            linewidth=2,
+        )
+
+    ax.set_xlabel("Hour of Day (Local Time)", fontsize=12)
+    ax.set_ylabel("Average Waiting Time Status", fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight="bold")
+    ax.set_xticks(range(0, 24))
+
+    ax.grid(True, alpha=0.3)
 
 
 def create_waiting_times_chart():
@@ -123,9 +185,6 @@ def create_waiting_times_chart():
     # Connect to the database
     engine = create_engine(common.get_db_path())
 
-    # Calculate the time range (from today at 6am local time)
-    start_time = get_today_6am_utc()
-
     with Session(engine) as db:
         # Query waiting times from today at 6am
         query = (
@@ -138,7 +197,8 @@ def create_waiting_times_chart():
             .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
             .join(Office, WaitingTime.office_id == Office.id)
             .join(Status, WaitingTime.status_id == Status.id)
-            .filter(Snapshot.captured_at >= start_time)
+            .filter(Snapshot.local_date == local_day.get_local_today())
+            .filter(Snapshot.local_minute >= DAY_START_MINUTE)
             .order_by(Snapshot.captured_at, Office.label)
         )
 
@@ -162,63 +222,22 @@ def create_waiting_times_chart():
         )
 
         # Convert timestamp to datetime and convert from UTC to local timezone
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        local_tz = get_system_timezone()
-        df["timestamp_local"] = df["timestamp"].apply(
-            lambda x: convert_utc_to_local(x, local_tz)
-        )
-
-        # Create the plot
-        fig, ax = plt.subplots(figsize=(15, 10))
-
-        # Get unique offices
-        offices = df["office"].unique()
-
-        # Create a color map for different offices
-        import numpy as np
-
-        colors = plt.get_cmap("tab10")(np.linspace(0, 1, len(offices)))
-
-        # Plot each office's waiting times
-        for i, office in enumerate(offices):
-            office_data = df[df["office"] == office].copy()
-            office_data = office_data.sort_values("timestamp_local")
-
-            # Convert status to numeric for plotting (use status_id)
-            ax.plot(
-                office_data["timestamp_local"],
-                office_data["status_id"],
-                label=office,
-                color=colors[i],
-                linewidth=1.5,
-                alpha=0.7,
-            )
-
-        # Customize the plot
-        ax.set_xlabel("Time (Local)", fontsize=12)
-        ax.set_ylabel("Waiting Time Status", fontsize=12)
-        ax.set_title(
-            "Waiting Times for All Offices - From Today 6am (Local Time)",
-            fontsize=14,
-            fontweight="bold",
-        )
-
-        # Format x-axis to show time nicely with local timezone
-        local_tz = get_system_timezone()
-        ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M", tz=local_tz))
-        ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
-
-        plt.xticks(rotation=45)
+        df["timestamp_local"] = to_local_timestamps(df["timestamp"])
 
         # Create custom y-axis labels based on status meanings
         status_labels = db.query(Status.id, Status.meaning).all()
         status_dict = {status.id: status.meaning for status in status_labels}
 
-        # Set y-axis ticks and labels
-        y_ticks = sorted(status_dict.keys())
-        y_labels = [status_dict[tick] for tick in y_ticks]
-        ax.set_yticks(y_ticks)
-        ax.set_yticklabels(y_labels, fontsize=10)
+        # Create the plot
+        fig, ax = plt.subplots(figsize=(15, 10))
+        plot_waiting_times(
+            ax,
+            df,
+            status_dict,
+            "Waiting Times for All Offices - From Today 6am (Local Time)",
+            tz=local_day.LOCAL_TIMEZONE,
+        )
+        offices = df["office"].unique()
 
         # Add legend
         legend = ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left", fontsize=10)
@@ -226,9 +245,6 @@ def create_waiting_times_chart():
         # Make the legend interactive
         make_legend_interactive(ax, legend)
 
-        # Add grid for better readability
-        ax.grid(True, alpha=0.3)
-
         # Adjust layout to prevent legend cutoff
         plt.tight_layout()
 
@@ -236,10 +252,9 @@ def create_waiting_times_chart():
         plt.show()
 
         # Print some statistics
-        local_tz = get_system_timezone()
         print("\nData Summary:")
         print(
-            f"Time range (local {local_tz}): {df['timestamp_local'].min()} to {df['timestamp_local'].max()}"
+            f"Time range (local {common.LOCAL_TIMEZONE}): {df['timestamp_local'].min()} to {df['timestamp_local'].max()}"
         )
         print(f"Number of offices: {len(offices)}")
         print(f"Total data points: {len(df)}")
@@ -250,19 +265,19 @@ def create_average_waiting_times_chart():
     """Create a chart showing average waiting times by hour for all offices from today at 6am local time."""
 
     engine = create_engine(common.get_db_path())
-    start_time = get_today_6am_utc()
 
     with Session(engine) as db:
         query = (
             db.query(
-                Snapshot.captured_at,
+                Snapshot.local_minute,
                 Office.label.label("office_name"),
                 Status.id.label("status_id"),
             )
             .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
             .join(Office, WaitingTime.office_id == Office.id)
             .join(Status, WaitingTime.status_id == Status.id)
-            .filter(Snapshot.captured_at >= start_time)
+            .filter(Snapshot.local_date == local_day.get_local_today())
+            .filter(Snapshot.local_minute >= DAY_START_MINUTE)
             .order_by(Snapshot.captured_at)
         )
 
@@ -275,7 +290,7 @@ def create_average_waiting_times_chart():
         df = pd.DataFrame(
             [
                 {
-                    "timestamp": row.captured_at,
+                    "local_minute": row.local_minute,
                     "office": row.office_name,
                     "status_id": row.status_id,
                 }
@@ -283,49 +298,23 @@ def create_average_waiting_times_chart():
             ]
         )
 
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        local_tz = get_system_timezone()
-        df["timestamp_local"] = df["timestamp"].apply(
-            lambda x: convert_utc_to_local(x, local_tz)
-        )
-        df["hour"] = df["timestamp_local"].dt.hour
+        df["hour"] = df["local_minute"] // 60
 
         # Calculate average waiting time by hour and office
         hourly_avg = df.groupby(["hour", "office"])["status_id"].mean().reset_index()
 
         # Create the plot
         fig, ax = plt.subplots(figsize=(12, 8))
-
-        offices = hourly_avg["office"].unique()
-        import numpy as np
-
-        colors = plt.get_cmap("tab10")(np.linspace(0, 1, len(offices)))
-
-        for i, office in enumerate(offices):
-            office_data = hourly_avg[hourly_avg["office"] == office]
-            ax.plot(
-                office_data["hour"],
-                office_data["status_id"],
-                label=office,
-                color=colors[i],
-                linewidth=2,
-            )
-
-        ax.set_xlabel("Hour of Day (Local Time)", fontsize=12)
-        ax.set_ylabel("Average Waiting Time Status", fontsize=12)
-        ax.set_title(
+        plot_average_waiting_times(
+            ax,
+            hourly_avg,
             "Average Waiting Times by Hour - From Today 6am (Local Time)",
-            fontsize=14,
-            fontweight="bold",
         )
-        ax.set_xticks(range(0, 24))
 
         # Add legend and make it interactive
         legend = ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
         make_legend_interactive(ax, legend)
 
-        ax.grid(True, alpha=0.3)
-
         plt.tight_layout()
         plt.show()
 
@@ -1,11 +1,19 @@
-from fastapi import FastAPI, Depends, HTTPException
-from models import Office, WaitingTime, Snapshot, Status
 from typing import Annotated
+
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+from loguru import logger
 import common
+import queries
+import asyncio
 import datetime as dt
+import status_cube
+import catalog
+import local_day
 
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import Session
 
 connect_args = {"check_same_thread": False}
@@ -13,140 +21,180 @@ engine = create_engine(
     common.get_db_path(), pool_size=30, max_overflow=30, connect_args=connect_args
 )
 
+# How often new snapshots are loaded from the DB into the status cube
+CUBE_REFRESH_INTERVAL = dt.timedelta(seconds=10)
+# Longest date range served by a single range query
+MAX_RANGE_DAYS = 31
+
+# All waiting time reads are answered from the cube. It is persisted next to the
+# DB and updated by a single refresh task, so the API must run in one process.
+cube = status_cube.StatusCube(common.get_cube_dir())
+# Offices and statuses, reloaded only when the scraper changes them
+office_catalog = catalog.Catalog(engine)
+
+
+def refresh_cube() -> int:
+    # The scraper creates the tables, until then there is nothing to load
+    if not inspect(engine).has_table("waiting_time"):
+        return 0
 
-def get_session():
     with Session(engine) as session:
-        yield session
+        return cube.refresh(session)
+
+
+async def refresh_cube_periodically():
+    while True:
+        await asyncio.sleep(CUBE_REFRESH_INTERVAL.total_seconds())
+        try:
+            await asyncio.to_thread(refresh_cube)
+        except Exception as e:
+            logger.error(f"Error during status cube refresh: {e}")
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(local_day.migrate_local_day, engine)
 
-app = FastAPI()
+    logger.info("Loading status cube...")
+    loaded = await asyncio.to_thread(refresh_cube)
+    logger.info(f"Status cube ready, loaded {loaded} new waiting times.")
+
+    await asyncio.to_thread(office_catalog.refresh)
+
+    refresh_task = asyncio.create_task(refresh_cube_periodically())
+    yield
+    refresh_task.cancel()
+
+
+# Responses are serialized with orjson, and endpoints return Response objects so
+# FastAPI skips its per-object jsonable_encoder pass
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 @app.get("/offices")
-async def get_offices(session: SessionDep):
+async def get_offices():
     """
-    Retrieve a list of offices.
+    Retrieve a list of offices with their features.
     """
-
-    offices = session.query(Office).all()
-    return offices
+    return Response(office_catalog.get_offices_json(), media_type="application/json")
 
 
 @app.get("/statuses")
-async def get_statuses(session: SessionDep):
+async def get_statuses():
     """
     Retrieve a list of waiting time statuses.
     """
-    statuses = session.query(Status).all()
-    return {status.id: status.meaning for status in statuses}
+    return Response(office_catalog.get_statuses_json(), media_type="application/json")
 
 
 @app.get("/all_waiting_times/{date}")
-async def get_waiting_times(date: str, session: SessionDep):
+async def get_waiting_times(date: str):
     """
     Retrieve waiting times for a specific date.
     Expected date format: YYYY-MM-DD
+
+    Closed days are also published as static files by publisher_main.py and
+    served by nginx, so in production this mostly answers requests for today.
     """
     try:
-        # Parse the date string
-        target_date = dt.datetime.strptime(date, "%Y-%m-%d").date()
+        target_date = queries.parse_date(date)
     except ValueError:
         raise HTTPException(
             status_code=400, detail=f"Invalid date format '{date}'. Expected YYYY-MM-DD"
         )
 
-    # Define the date range for the target date (00:00:00 to 23:59:59 UTC)
-    start_datetime = dt.datetime.combine(target_date, dt.time.min).replace(
-        tzinfo=dt.UTC
-    )
-    end_datetime = dt.datetime.combine(target_date, dt.time.max).replace(tzinfo=dt.UTC)
-
-    # Query waiting times for the specified date
-    query = (
-        session.query(
-            Snapshot.captured_at,
-            Office.id.label("office_id"),
-            Status.id.label("status_id"),
+    waiting_times = cube.get_day(target_date)
+
+    if not waiting_times:
+        raise HTTPException(
+            status_code=404, detail=f"No waiting times found for date {date}"
         )
-        .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
-        .join(Office, WaitingTime.office_id == Office.id)
-        .join(Status, WaitingTime.status_id == Status.id)
-        .filter(Snapshot.captured_at >= start_datetime)
-        .filter(Snapshot.captured_at <= end_datetime)
-        .order_by(Snapshot.captured_at, Office.label)
-    )
 
-    results = query.all()
+    return ORJSONResponse(waiting_times)
+
 
-    if not results:
+@app.get("/waiting_times/{office_id}/{date}")
+async def get_waiting_times_for_office(office_id: int, date: str):
+    """
+    Retrieve waiting times for a specific office on a specific date.
+    Expected date format: YYYY-MM-DD
+    """
+    try:
+        target_date = queries.parse_date(date)
+    except ValueError:
         raise HTTPException(
-            status_code=404, detail=f"No waiting times found for date {date}"
+            status_code=400, detail=f"Invalid date format '{date}'. Expected YYYY-MM-DD"
         )
 
-    # Convert results to dict that maps office ids to their waiting time IDs over time
-    waiting_times = {}
-    for captured_at, office_id, status_id in results:
-        waiting_times.setdefault(office_id, []).append(
-            {
-                "captured_at": captured_at.isoformat(),
-                "status_id": status_id,
-            }
+    waiting_times = cube.get_office_range(office_id, target_date, target_date)
+
+    if not waiting_times:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No waiting times found for office {office_id} on date {date}",
         )
 
-    return waiting_times
+    return ORJSONResponse(waiting_times)
 
 
-@app.get("/waiting_times/{office_id}/{date}")
-async def get_waiting_times_for_office(office_id: int, date: str, session: SessionDep):
+@app.get("/waiting_time_updates/{office_id}/{date}")
+async def get_waiting_time_updates_for_office(
+    office_id: int, date: str, since_snapshot: Annotated[int, Query(ge=0)] = 0
+):
     """
-    Retrieve waiting times for a specific office on a specific date.
+    Retrieve the waiting times of a specific office on a specific date that were
+    captured after the snapshot since_snapshot, together with a cursor to pass
+    as since_snapshot on the next poll. since_snapshot=0 returns the whole day.
     Expected date format: YYYY-MM-DD
+
+    Lives outside /waiting_times/ so nginx never answers it with a published
+    static file.
     """
     try:
-        # Parse the date string
-        target_date = dt.datetime.strptime(date, "%Y-%m-%d").date()
+        target_date = queries.parse_date(date)
     except ValueError:
         raise HTTPException(
             status_code=400, detail=f"Invalid date format '{date}'. Expected YYYY-MM-DD"
         )
 
-    # Define the date range for the target date (00:00:00 to 23:59:59 UTC)
-    start_datetime = dt.datetime.combine(target_date, dt.time.min).replace(
-        tzinfo=dt.UTC
+    waiting_times, cursor = cube.get_office_updates(
+        office_id, target_date, since_snapshot
     )
-    end_datetime = dt.datetime.combine(target_date, dt.time.max).replace(tzinfo=dt.UTC)
 
-    # Query waiting times for the specified office and date
-    query = (
-        session.query(
-            Snapshot.captured_at,
-            Status.id.label("status_id"),
+    return ORJSONResponse({"waiting_times": waiting_times, "cursor": cursor})
+
+
+@app.get("/waiting_times/{office_id}/{start_date}/{end_date}")
+async def get_waiting_times_for_office_range(
+    office_id: int, start_date: str, end_date: str
+):
+    """
+    Retrieve waiting times for a specific office from start_date to end_date
+    (inclusive), at most 31 days.
+    Expected date format: YYYY-MM-DD
+    """
+    try:
+        start = queries.parse_date(start_date)
+        end = queries.parse_date(end_date)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid date range '{start_date}/{end_date}'. Expected YYYY-MM-DD",
+        )
+
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Date range must span 1 to {MAX_RANGE_DAYS} days",
         )
-        .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
-        .join(Status, WaitingTime.status_id == Status.id)
-        .filter(WaitingTime.office_id == office_id)
-        .filter(Snapshot.captured_at >= start_datetime)
-        .filter(Snapshot.captured_at <= end_datetime)
-        .order_by(Snapshot.captured_at)
-    )
 
-    results = query.all()
+    waiting_times = cube.get_office_range(office_id, start, end)
 
-    if not results:
+    if not waiting_times:
         raise HTTPException(
             status_code=404,
-            detail=f"No waiting times found for office {office_id} on date {date}",
+            detail=f"No waiting times found for office {office_id} "
+            f"from {start_date} to {end_date}",
         )
 
-    # Convert results to dict that maps captured_at to status IDs
-    waiting_times = [
-        {
-            "captured_at": captured_at.isoformat(),
-            "status_id": status_id,
-        }
-        for captured_at, status_id in results
-    ]
-
-    return waiting_times
+    return ORJSONResponse(waiting_times)
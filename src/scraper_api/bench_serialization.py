@@ -0,0 +1,98 @@
+import json
+import random
+import timeit
+import argparse
+import datetime as dt
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import common
+import queries
+import local_day
+
+# Compares FastAPI's default response serialization (jsonable_encoder followed
+# by JSONResponse) with ORJSONResponse on /all_waiting_times day payloads.
+
+EXAMPLE_RESPONSE = Path(__file__).with_name("example_response.json")
+
+
+def make_synthetic_day(office_count: int) -> dict[int, list[dict]]:
+    """
+    A day payload with one sample per minute from 6am to 8pm for every office.
+    """
+    rng = random.Random(0)
+    start = dt.datetime(2025, 1, 6, 5, 0, 2, 123456)
+    timestamps = [
+        (start + dt.timedelta(minutes=minute)).isoformat() for minute in range(14 * 60)
+    ]
+    return {
+        office_id: [
+            {"captured_at": captured_at, "status_id": rng.choice((0, 1, 2, 3, 11))}
+            for captured_at in timestamps
+        ]
+        for office_id in range(1, office_count + 1)
+    }
+
+
+def render_default(payload) -> bytes:
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def render_orjson(payload) -> bytes:
+    return ORJSONResponse(payload).body
+
+
+def bench(name: str, render, payload, number: int) -> float:
+    best = min(timeit.repeat(lambda: render(payload), number=number, repeat=5))
+    ms = best / number * 1000
+    print(f"  {name:<32} {ms:8.2f} ms")
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark JSON serialization of day payloads."
+    )
+    parser.add_argument(
+        "--date",
+        type=dt.date.fromisoformat,
+        help="use this day from the DB instead of a synthetic payload",
+    )
+    parser.add_argument(
+        "--offices",
+        type=int,
+        default=len(json.loads(EXAMPLE_RESPONSE.read_text())),
+        help="number of offices in the synthetic payload",
+    )
+    parser.add_argument("--number", type=int, default=20, help="runs per timing")
+    args = parser.parse_args()
+
+    if args.date:
+        engine = create_engine(common.get_db_path())
+        local_day.migrate_local_day(engine)
+        with Session(engine) as session:
+            payload = queries.query_all_waiting_times(session, args.date)
+        description = f"{args.date} from the DB"
+    else:
+        payload = make_synthetic_day(args.offices)
+        description = f"synthetic day, {args.offices} offices"
+
+    samples = sum(len(series) for series in payload.values())
+    default_body = render_default(payload)
+    orjson_body = render_orjson(payload)
+    assert json.loads(default_body) == json.loads(orjson_body)
+
+    print(f"Payload: {description}, {samples} samples, {len(orjson_body)} bytes")
+    default_ms = bench(
+        "jsonable_encoder + JSONResponse", render_default, payload, args.number
+    )
+    orjson_ms = bench("ORJSONResponse", render_orjson, payload, args.number)
+    print(f"  speedup {default_ms / orjson_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import threading
+
+import orjson
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, joinedload
+
+import common
+from models import Office, Status
+
+# In-memory copy of the small, rarely changing tables, kept as ready-to-send
+# JSON. The scraper touches the catalog version file whenever office metadata
+# changes, which makes the next request reload the catalog.
+
+
+def get_catalog_version() -> int | None:
+    try:
+        return os.stat(common.get_catalog_version_path()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_offices(session: Session) -> list[dict]:
+    """
+    Load all offices with their features in a single query.
+    """
+    offices = (
+        session.query(Office)
+        .options(joinedload(Office.features))
+        .order_by(Office.id)
+        .all()
+    )
+    return [
+        {
+            "id": office.id,
+            "label": office.label,
+            "url": office.url,
+            "features": sorted(feature.name for feature in office.features),
+        }
+        for office in offices
+    ]
+
+
+def load_statuses(session: Session) -> dict[int, str]:
+    return dict(session.query(Status.id, Status.meaning).order_by(Status.id).all())
+
+
+class Catalog:
+    """
+    Offices and statuses, serialized once per catalog version.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.loaded_version = None
+        self.loaded = False
+        self.offices: list[dict] = []
+        self.statuses: dict[int, str] = {}
+        self.offices_json = b""
+        self.statuses_json = b""
+
+    def reload(self):
+        offices, statuses = [], {}
+        # Empty until the scraper created the tables. Its first snapshot adds
+        # the offices and touches the version file.
+        if inspect(self.engine).has_table("office"):
+            with Session(self.engine) as session:
+                offices = load_offices(session)
+                statuses = load_statuses(session)
+
+        self.offices = offices
+        self.statuses = statuses
+        self.offices_json = orjson.dumps(offices)
+        self.statuses_json = orjson.dumps(statuses, option=orjson.OPT_NON_STR_KEYS)
+
+    def refresh(self):
+        """
+        Reload the catalog if it was never loaded or the scraper changed it.
+        """
+        version = get_catalog_version()
+        if self.loaded and version == self.loaded_version:
+            return
+
+        with self.lock:
+            if self.loaded and version == self.loaded_version:
+                return
+            self.reload()
+            self.loaded_version = version
+            self.loaded = True
+
+    def get_offices_json(self) -> bytes:
+        self.refresh()
+        return self.offices_json
+
+    def get_statuses_json(self) -> bytes:
+        self.refresh()
+        return self.statuses_json
@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import argparse
+import datetime as dt
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import analysis
+import common
+import local_day
+import columnar_cache
+import waiting_stats
+from models import Office, Status
+
+# Render headless, without the interactive backend analysis.py uses
+matplotlib.use("Agg")
+
+# Renders waiting time charts for many offices and periods in parallel, reusing
+# charts whose underlying data did not change since the last run
+
+CHART_KINDS = ("waiting_times", "hourly_average")
+PERIOD_DAYS = {"day": 1, "week": 7}
+
+# Bump to re-render all charts after changing how they look
+RENDER_VERSION = 1
+
+# Data shared by all charts of a worker process, set by init_worker()
+worker_columns: columnar_cache.WaitingTimeColumns | None = None
+worker_days_sorted = False
+worker_status_dict: dict[int, str] = {}
+worker_office_labels: dict[int, str] = {}
+
+
+@dataclass(frozen=True)
+class ChartJob:
+    kind: str
+    office_id: int
+    # First and last day (inclusive) of the period
+    start: dt.date
+    end: dt.date
+    fmt: str
+    # Changes whenever the rows of the chart change
+    data_version: str
+
+    @property
+    def filename(self) -> str:
+        return f"{self.kind}/{self.office_id}/{self.start}_{self.end}.{self.fmt}"
+
+
+def get_period_start(df: pd.DataFrame, period: str) -> pd.Series:
+    if period == "week":
+        return df["date"] - pd.to_timedelta(df["weekday"], unit="D")
+    return df["date"]
+
+
+def build_jobs(
+    frame: pd.DataFrame,
+    office_ids: list[int] | None,
+    start: dt.date | None,
+    end: dt.date | None,
+    period: str,
+    kinds: list[str],
+    formats: list[str],
+) -> list[ChartJob]:
+    """
+    Create one job per office, period, chart kind and format with data in the
+    selected range. Periods are clipped to the range, so a chart contains
+    exactly the rows its data version was computed from.
+    """
+    selection = frame
+    if office_ids:
+        selection = selection[selection["office_id"].isin(office_ids)]
+    if start:
+        selection = selection[selection["date"] >= pd.Timestamp(start)]
+    if end:
+        selection = selection[selection["date"] <= pd.Timestamp(end)]
+
+    # The number of rows and the newest snapshot identify the data of a chart
+    versions = selection.groupby(
+        [selection["office_id"], get_period_start(selection, period)]
+    )["snapshot_id"].agg(["count", "max"])
+
+    period_length = dt.timedelta(days=PERIOD_DAYS[period] - 1)
+    return [
+        ChartJob(
+            kind=kind,
+            office_id=int(office_id),
+            start=max(period_start.date(), start or dt.date.min),
+            end=min(period_start.date() + period_length, end or dt.date.max),
+            fmt=fmt,
+            data_version=f"{RENDER_VERSION}-{row['count']}-{row['max']}",
+        )
+        for (office_id, period_start), row in versions.iterrows()
+        for kind in kinds
+        for fmt in formats
+    ]
+
+
+def is_sorted_by_day(columns: columnar_cache.WaitingTimeColumns) -> bool:
+    # Rows are ordered by waiting_time id, and snapshots are inserted in capture
+    # order, so this normally holds
+    return bool(np.all(columns.local_date[1:] >= columns.local_date[:-1]))
+
+
+def init_worker(
+    status_dict: dict[int, str], office_labels: dict[int, str], days_sorted: bool
+):
+    global worker_columns, worker_days_sorted
+    global worker_status_dict, worker_office_labels
+
+    # All workers memory-map the same cache files instead of querying the DB.
+    # Only the rows of a chart are copied, in render_chart().
+    worker_columns = columnar_cache.open_columns(columnar_cache.get_column_dir())
+    worker_days_sorted = days_sorted
+    worker_status_dict = status_dict
+    worker_office_labels = office_labels
+
+
+def select_rows(
+    columns: columnar_cache.WaitingTimeColumns, job: ChartJob, days_sorted: bool
+) -> np.ndarray:
+    """
+    Return the indices of the rows of the job's office and period.
+    """
+    first_day = (job.start - dt.date(1970, 1, 1)).days
+    last_day = (job.end - dt.date(1970, 1, 1)).days
+
+    if not days_sorted:
+        return np.flatnonzero(
+            (columns.local_date >= first_day)
+            & (columns.local_date <= last_day)
+            & (columns.office_id == job.office_id)
+        )
+
+    # Binary search for the period, then only scan its rows for the office
+    first = np.searchsorted(columns.local_date, first_day, side="left")
+    last = np.searchsorted(columns.local_date, last_day, side="right")
+    return first + np.flatnonzero(columns.office_id[first:last] == job.office_id)
+
+
+def render_chart(job: ChartJob, output_dir: Path) -> ChartJob:
+    rows = select_rows(worker_columns, job, worker_days_sorted)
+    selection = waiting_stats.to_frame(worker_columns.take(rows))
+    label = worker_office_labels.get(job.office_id, str(job.office_id))
+    period = f"{job.start}" if job.start == job.end else f"{job.start} to {job.end}"
+
+    df = pd.DataFrame(
+        {
+            "timestamp_local": selection["local_time"],
+            "office": label,
+            "status_id": selection["status_id"],
+        }
+    )
+
+    if job.kind == "waiting_times":
+        fig, ax = plt.subplots(figsize=(15, 10))
+        analysis.plot_waiting_times(
+            ax, df, worker_status_dict, f"Waiting Times {label} - {period}"
+        )
+    else:
+        df["hour"] = selection["hour"]
+        hourly_avg = df.groupby(["hour", "office"])["status_id"].mean().reset_index()
+        fig, ax = plt.subplots(figsize=(12, 8))
+        analysis.plot_average_waiting_times(
+            ax, hourly_avg, f"Average Waiting Times by Hour {label} - {period}"
+        )
+
+    fig.tight_layout()
+
+    path = output_dir / job.filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}")
+    fig.savefig(tmp_path, format=job.fmt)
+    plt.close(fig)
+    os.replace(tmp_path, path)
+
+    return job
+
+
+def read_manifest(output_dir: Path) -> dict[str, str]:
+    try:
+        return json.loads((output_dir / "manifest.json").read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(output_dir: Path, manifest: dict[str, str]):
+    tmp_path = output_dir / ".manifest.json.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, output_dir / "manifest.json")
+
+
+def render_charts(
+    jobs: list[ChartJob],
+    output_dir: Path,
+    status_dict: dict[int, str],
+    office_labels: dict[int, str],
+    workers: int | None = None,
+    force: bool = False,
+) -> int:
+    """
+    Render all jobs whose chart is missing or outdated. Returns the number of
+    rendered charts.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(output_dir)
+
+    pending = [
+        job
+        for job in jobs
+        if force
+        or manifest.get(job.filename) != job.data_version
+        or not (output_dir / job.filename).exists()
+    ]
+    if not pending:
+        return 0
+
+    columns = columnar_cache.open_columns(columnar_cache.get_column_dir())
+    days_sorted = is_sorted_by_day(columns)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(status_dict, office_labels, days_sorted),
+    ) as pool:
+        for job in pool.map(
+            partial(render_chart, output_dir=output_dir), pending, chunksize=8
+        ):
+            manifest[job.filename] = job.data_version
+
+    write_manifest(output_dir, manifest)
+
+    return len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render waiting time charts per office and period."
+    )
+    parser.add_argument(
+        "--offices", type=int, nargs="+", help="office ids (default: all)"
+    )
+    parser.add_argument("--start", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--end", type=dt.date.fromisoformat, help="YYYY-MM-DD")
+    parser.add_argument("--period", choices=PERIOD_DAYS, default="week")
+    parser.add_argument(
+        "--kinds", nargs="+", choices=CHART_KINDS, default=list(CHART_KINDS)
+    )
+    parser.add_argument("--formats", nargs="+", choices=("png", "svg"), default=["png"])
+    parser.add_argument("--output", type=Path, default=Path("data/charts"))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="re-render up-to-date charts"
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(common.get_db_path())
+    local_day.migrate_local_day(engine)
+
+    start = time.perf_counter()
+    frame = waiting_stats.to_frame(columnar_cache.load_waiting_times(engine))
+
+    with Session(engine) as db:
+        status_dict = dict(db.query(Status.id, Status.meaning).all())
+        office_labels = dict(db.query(Office.id, Office.label).all())
+
+    jobs = build_jobs(
+        frame, args.offices, args.start, args.end, args.period, args.kinds, args.formats
+    )
+    logger.info(f"Prepared {len(jobs)} charts in {time.perf_counter() - start:.2f} s.")
+
+    start = time.perf_counter()
+    rendered = render_charts(
+        jobs, args.output, status_dict, office_labels, args.workers, args.force
+    )
+    logger.info(
+        f"Rendered {rendered} charts ({len(jobs) - rendered} up to date) "
+        f"in {time.perf_counter() - start:.1f} s."
+    )
+
+
+if __name__ == "__main__":
+    is_debug = os.getenv("DEBUG", "0") == "1" or os.getenv("DEBUG", "0") == "true"
+    loglevel = "DEBUG" if is_debug else "INFO"
+
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    main()
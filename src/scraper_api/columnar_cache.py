@@ -0,0 +1,224 @@
+import os
+import json
+import fcntl
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import common
+import local_day
+from models import Snapshot, WaitingTime
+
+# Bump when the columns or their units change, the cache is then rebuilt from
+# the DB
+CACHE_VERSION = 1
+
+# Column name -> dtype of the on-disk arrays, one .npy file per column
+COLUMNS = {
+    "id": np.int64,
+    "snapshot_id": np.int64,
+    # Microseconds since the epoch (UTC)
+    "captured_at": np.int64,
+    # Snapshot.local_date as days since the epoch, and Snapshot.local_minute
+    "local_date": np.int32,
+    "local_minute": np.int16,
+    "office_id": np.int16,
+    "status_id": np.int8,
+}
+
+
+@dataclass
+class WaitingTimeColumns:
+    """
+    The waiting_time table joined with snapshot.captured_at, one array per column,
+    ordered by waiting_time.id.
+    """
+
+    id: np.ndarray
+    snapshot_id: np.ndarray
+    captured_at: np.ndarray
+    local_date: np.ndarray
+    local_minute: np.ndarray
+    office_id: np.ndarray
+    status_id: np.ndarray
+
+    def __len__(self):
+        return len(self.id)
+
+    @property
+    def last_id(self) -> int:
+        return int(self.id[-1]) if len(self.id) else 0
+
+    def take(self, rows: np.ndarray) -> "WaitingTimeColumns":
+        """
+        Copy the given rows into in-memory arrays.
+        """
+        return WaitingTimeColumns(
+            **{name: getattr(self, name)[rows] for name in COLUMNS}
+        )
+
+
+def get_column_dir() -> Path:
+    return common.get_cache_dir() / "waiting_time"
+
+
+def empty_columns() -> WaitingTimeColumns:
+    return WaitingTimeColumns(
+        **{name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    )
+
+
+@contextmanager
+def lock_columns(column_dir: Path, operation: int = fcntl.LOCK_EX):
+    """
+    Hold an flock on the cache directory. The nightly CLIs append to the cache
+    under an exclusive lock; readers take a shared one so they never see the
+    columns of two different writes.
+    """
+    column_dir.mkdir(parents=True, exist_ok=True)
+    with open(column_dir / ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, operation)
+        yield
+
+
+def read_columns(column_dir: Path) -> WaitingTimeColumns:
+    """
+    Memory-map the cached columns. Returns empty columns if the cache is missing,
+    outdated or inconsistent, e.g. after an interrupted write.
+    """
+    try:
+        meta = json.loads((column_dir / "meta.json").read_text())
+    except FileNotFoundError:
+        meta = {}
+    if meta.get("version") != CACHE_VERSION:
+        return empty_columns()
+
+    try:
+        arrays = {
+            name: np.load(column_dir / f"{name}.npy", mmap_mode="r") for name in COLUMNS
+        }
+    except (FileNotFoundError, ValueError):
+        return empty_columns()
+
+    if len({len(array) for array in arrays.values()}) != 1:
+        return empty_columns()
+
+    return WaitingTimeColumns(**arrays)
+
+
+def open_columns(column_dir: Path) -> WaitingTimeColumns:
+    """
+    Memory-map the cached columns while no other process is writing them.
+    """
+    with lock_columns(column_dir, fcntl.LOCK_SH):
+        return read_columns(column_dir)
+
+
+@contextmanager
+def replace_file(path: Path):
+    """
+    Open a uniquely named temp file next to path, which replaces path when the
+    block completes.
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    ) as f:
+        try:
+            yield f
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def write_columns(column_dir: Path, columns: WaitingTimeColumns):
+    """
+    Replace the cached columns. Call with lock_columns() held.
+    """
+    column_dir.mkdir(parents=True, exist_ok=True)
+    for name in COLUMNS:
+        with replace_file(column_dir / f"{name}.npy") as f:
+            np.save(f, getattr(columns, name))
+
+    # Written last, a cache without it is rebuilt
+    with replace_file(column_dir / "meta.json") as f:
+        f.write(json.dumps({"version": CACHE_VERSION}).encode())
+
+
+def fetch_rows_after(session: Session, last_id: int) -> WaitingTimeColumns:
+    """
+    Read all waiting_time rows with an id greater than last_id from the DB.
+    """
+    query = (
+        select(
+            WaitingTime.id,
+            WaitingTime.snapshot_id,
+            Snapshot.captured_at,
+            Snapshot.local_date,
+            Snapshot.local_minute,
+            WaitingTime.office_id,
+            WaitingTime.status_id,
+        )
+        .join(Snapshot, WaitingTime.snapshot_id == Snapshot.id)
+        .filter(WaitingTime.id > last_id)
+        .order_by(WaitingTime.id)
+    )
+
+    df = pd.DataFrame(session.execute(query).all(), columns=list(COLUMNS))
+    if df.empty:
+        return empty_columns()
+
+    # Snapshots stored by a scraper that predates the local day columns, after
+    # this process ran migrate_local_day()
+    missing = df["local_date"].isna()
+    if missing.any():
+        local_date, local_minute = local_day.to_local_days(
+            df.loc[missing, "captured_at"]
+        )
+        df.loc[missing, "local_date"] = local_date
+        df.loc[missing, "local_minute"] = local_minute
+
+    # captured_at is stored as naive UTC
+    captured_at = pd.to_datetime(df["captured_at"], utc=True).dt.as_unit("us")
+    df["captured_at"] = captured_at.astype("int64")
+    local_date = pd.to_datetime(df["local_date"]).to_numpy().astype("datetime64[D]")
+    df["local_date"] = local_date.astype("int64")
+
+    return WaitingTimeColumns(
+        **{name: df[name].to_numpy(dtype=dtype) for name, dtype in COLUMNS.items()}
+    )
+
+
+def load_waiting_times(engine) -> WaitingTimeColumns:
+    """
+    Load the full waiting_time history from the columnar cache, first appending
+    rows that were added to the DB since the cache was last written.
+    """
+    column_dir = get_column_dir()
+
+    # Held from reading the cache to writing it back, so concurrent runs of the
+    # CLIs neither interleave their writes nor append the same rows twice
+    with lock_columns(column_dir):
+        cached = read_columns(column_dir)
+
+        with Session(engine) as session:
+            new_rows = fetch_rows_after(session, cached.last_id)
+
+        if not len(new_rows):
+            return cached
+
+        columns = WaitingTimeColumns(
+            **{
+                name: np.concatenate([getattr(cached, name), getattr(new_rows, name)])
+                for name in COLUMNS
+            }
+        )
+        write_columns(column_dir, columns)
+
+        return read_columns(column_dir)
@@ -1,2 +1,28 @@
+from pathlib import Path
+
+# Office hours of the Stuttgart offices are in local time
+LOCAL_TIMEZONE = "Europe/Berlin"
+
+
 def get_db_path():
     return "sqlite:///data/waiting_times.sqlite"
+
+
+def get_static_dir():
+    # Versioned because nginx serves these files as immutable. Bump it when the
+    # payloads change meaning (v2: days are local days instead of UTC days), and
+    # the root in containers/frontend/nginx.conf with it.
+    return Path("data/static/v2")
+
+
+def get_cache_dir():
+    return Path("data/cache")
+
+
+def get_cube_dir():
+    return Path("data/cube")
+
+
+def get_catalog_version_path():
+    # Touched by the scraper whenever office metadata changes
+    return Path("data/catalog.version")
@@ -0,0 +1,124 @@
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from loguru import logger
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import common
+from models import Snapshot
+
+# Snapshot.local_date and Snapshot.local_minute: the Europe/Berlin day and minute
+# of the day of each snapshot. In the night the clocks go back, the minutes from
+# 02:00 to 02:59 occur twice; the offices are closed then.
+
+LOCAL_TIMEZONE = ZoneInfo(common.LOCAL_TIMEZONE)
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def to_local_day(captured_at: dt.datetime) -> tuple[dt.date, int]:
+    """
+    Return the local date and minute of the day of a UTC timestamp.
+    """
+    if captured_at.tzinfo is None:
+        captured_at = captured_at.replace(tzinfo=dt.UTC)
+    local_time = captured_at.astimezone(LOCAL_TIMEZONE)
+    return local_time.date(), local_time.hour * 60 + local_time.minute
+
+
+def to_local_days(captured_at: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """
+    Vectorized to_local_day() of naive UTC timestamps.
+    """
+    local_time = pd.to_datetime(captured_at, utc=True).dt.tz_convert(
+        common.LOCAL_TIMEZONE
+    )
+    return local_time.dt.date, local_time.dt.hour * 60 + local_time.dt.minute
+
+
+def get_local_today() -> dt.date:
+    return dt.datetime.now(LOCAL_TIMEZONE).date()
+
+
+def has_local_day_columns(engine) -> bool:
+    columns = {column["name"] for column in inspect(engine).get_columns("snapshot")}
+    return "local_date" in columns
+
+
+def add_local_day_columns(engine):
+    """
+    Add the local day columns to snapshot tables created before they existed.
+    """
+    if has_local_day_columns(engine):
+        return
+
+    logger.info("Adding local day columns to the snapshot table...")
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE snapshot ADD COLUMN local_date DATE"))
+            connection.execute(
+                text("ALTER TABLE snapshot ADD COLUMN local_minute SMALLINT")
+            )
+            connection.execute(
+                text("CREATE INDEX ix_snapshot_local_date ON snapshot (local_date)")
+            )
+    except OperationalError:
+        # The scraper, API and publisher all migrate at startup. If another one
+        # added the columns first, this transaction fails and is rolled back.
+        if not has_local_day_columns(engine):
+            raise
+        logger.info("Local day columns were added by another process.")
+
+
+def backfill_local_day(engine) -> int:
+    """
+    Compute the local day columns of all snapshots that do not have them yet.
+    Returns the number of updated snapshots.
+    """
+    updated = 0
+
+    with Session(engine) as db:
+        while True:
+            rows = db.execute(
+                select(Snapshot.id, Snapshot.captured_at)
+                .filter(Snapshot.local_date.is_(None))
+                .order_by(Snapshot.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+
+            df = pd.DataFrame(rows, columns=["id", "captured_at"])
+            local_date, local_minute = to_local_days(df["captured_at"])
+
+            db.execute(
+                update(Snapshot),
+                [
+                    {"id": id, "local_date": local_date, "local_minute": minute}
+                    for id, local_date, minute in zip(
+                        df["id"].tolist(),
+                        local_date.tolist(),
+                        local_minute.tolist(),
+                    )
+                ],
+            )
+            db.commit()
+            updated += len(df)
+
+    if updated:
+        logger.info(f"Backfilled the local day of {updated} snapshots.")
+
+    return updated
+
+
+def migrate_local_day(engine):
+    # Until the scraper created the tables, with these columns, there is nothing
+    # to migrate
+    if not inspect(engine).has_table("snapshot"):
+        return
+
+    add_local_day_columns(engine)
+    backfill_local_day(engine)
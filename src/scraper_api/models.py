@@ -4,6 +4,8 @@ from typing import List
 from sqlalchemy import (
     String,
     Integer,
+    SmallInteger,
+    Date,
     DateTime,
     ForeignKey,
     Text,
@@ -101,6 +103,10 @@ class Snapshot(Base):
         default=lambda: dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc),
         index=True,
     )
+    # Day and minute of the day of captured_at in Europe/Berlin, precomputed so
+    # reads can filter and group by local day without converting timezones
+    local_date: Mapped[dt.date | None] = mapped_column(Date, index=True)
+    local_minute: Mapped[int | None] = mapped_column(SmallInteger)
 
     samples: Mapped[List["WaitingTime"]] = relationship(
         back_populates="snapshot", cascade="all, delete-orphan"
@@ -0,0 +1,183 @@
+import os
+import sys
+import gzip
+import time
+import brotli
+import orjson
+import common
+import queries
+import local_day
+import argparse
+import datetime
+from loguru import logger
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+from models import Snapshot
+
+
+# How often the publisher checks for newly closed days
+PUBLISH_INTERVAL = datetime.timedelta(minutes=10)
+# Grace period after local midnight so the last snapshots of a day are in the DB
+PUBLISH_DELAY = datetime.timedelta(minutes=5)
+
+# Engine of the current worker process, created by init_worker()
+worker_engine = None
+
+
+def serialize(payload) -> bytes:
+    # Same encoding as the API's ORJSONResponse
+    return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+
+def write_atomically(path: Path, body: bytes):
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(body)
+    os.replace(tmp_path, path)
+
+
+def write_static_file(path: Path, body: bytes):
+    """
+    Write the plain file plus pre-compressed .gz and .br variants next to it.
+    nginx picks the variant matching the client's Accept-Encoding.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Compressed variants first, so nginx never sees the plain file without them
+    write_atomically(path.with_name(f"{path.name}.gz"), gzip.compress(body, 9, mtime=0))
+    write_atomically(
+        path.with_name(f"{path.name}.br"), brotli.compress(body, quality=11)
+    )
+    write_atomically(path, body)
+
+
+def get_day_file(static_dir: Path, target_date: datetime.date) -> Path:
+    return static_dir / "all_waiting_times" / target_date.isoformat()
+
+
+def get_office_day_file(
+    static_dir: Path, office_id: int, target_date: datetime.date
+) -> Path:
+    return static_dir / "waiting_times" / str(office_id) / target_date.isoformat()
+
+
+def init_worker():
+    global worker_engine
+    worker_engine = create_engine(common.get_db_path())
+
+
+def publish_day(target_date: datetime.date) -> int:
+    """
+    Render the /all_waiting_times and all /waiting_times payloads of one day.
+    Returns the number of published payloads.
+    """
+    static_dir = common.get_static_dir()
+
+    with Session(worker_engine) as db:
+        waiting_times = queries.query_all_waiting_times(db, target_date)
+
+    if not waiting_times:
+        return 0
+
+    # The per-office payloads are exactly the per-office lists of the day payload
+    for office_id, office_waiting_times in waiting_times.items():
+        write_static_file(
+            get_office_day_file(static_dir, office_id, target_date),
+            serialize(office_waiting_times),
+        )
+
+    # Written last, it marks the day as published
+    write_static_file(get_day_file(static_dir, target_date), serialize(waiting_times))
+
+    return len(waiting_times) + 1
+
+
+def get_closed_days(engine) -> list[datetime.date]:
+    # The scraper creates the tables
+    if not inspect(engine).has_table("snapshot"):
+        return []
+
+    now = datetime.datetime.now(local_day.LOCAL_TIMEZONE) - PUBLISH_DELAY
+
+    with Session(engine) as db:
+        rows = (
+            db.query(Snapshot.local_date)
+            .filter(Snapshot.local_date < now.date())
+            .distinct()
+            .all()
+        )
+
+    return sorted(day for (day,) in rows)
+
+
+def get_unpublished_days(engine) -> list[datetime.date]:
+    static_dir = common.get_static_dir()
+    return [
+        day
+        for day in get_closed_days(engine)
+        if not get_day_file(static_dir, day).exists()
+    ]
+
+
+def publish_days(days: list[datetime.date], workers: int | None = None):
+    if not days:
+        return
+
+    logger.info(f"Publishing {len(days)} day(s) from {days[0]} to {days[-1]}...")
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        published = sum(pool.map(publish_day, days))
+
+    logger.info(
+        f"Published {published} payloads in {time.perf_counter() - start:.1f} s."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Publish the waiting times of closed days as static files."
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="regenerate all closed days and exit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(common.get_db_path())
+    local_day.migrate_local_day(engine)
+
+    if args.all:
+        publish_days(get_closed_days(engine), args.workers)
+        return
+
+    logger.info("Starting static day publisher...")
+
+    while True:
+        try:
+            # Fills in snapshots stored by a scraper that predates the local
+            # day columns, so their days are published completely
+            local_day.migrate_local_day(engine)
+            publish_days(get_unpublished_days(engine), args.workers)
+        except Exception as e:
+            logger.error(f"Error during publishing: {e}")
+
+        time.sleep(PUBLISH_INTERVAL.total_seconds())
+
+
+if __name__ == "__main__":
+    is_debug = os.getenv("DEBUG", "0") == "1" or os.getenv("DEBUG", "0") == "true"
+    loglevel = "DEBUG" if is_debug else "INFO"
+
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+    logger.add("publisher.log", rotation="1 MB", level=loglevel)
+
+    main()
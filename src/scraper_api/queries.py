@@ -0,0 +1,42 @@
+import datetime as dt
+from sqlalchemy.orm import Session
+from models import Office, WaitingTime, Snapshot, Status
+
+
+def parse_date(date: str) -> dt.date:
+    """
+    Parse a YYYY-MM-DD date string. Raises ValueError on invalid input.
+    """
+    return dt.datetime.strptime(date, "%Y-%m-%d").date()
+
+
+def query_all_waiting_times(
+    session: Session, target_date: dt.date
+) -> dict[int, list[dict]]:
+    """
+    Return a dict that maps office ids to their waiting times over the given local
+    (Europe/Berlin) day.
+    """
+    query = (
+        session.query(
+            Snapshot.captured_at,
+            Office.id.label("office_id"),
+            Status.id.label("status_id"),
+        )
+        .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
+        .join(Office, WaitingTime.office_id == Office.id)
+        .join(Status, WaitingTime.status_id == Status.id)
+        .filter(Snapshot.local_date == target_date)
+        .order_by(Snapshot.captured_at, Office.label)
+    )
+
+    waiting_times = {}
+    for captured_at, office_id, status_id in query.all():
+        waiting_times.setdefault(office_id, []).append(
+            {
+                "captured_at": captured_at.isoformat(),
+                "status_id": status_id,
+            }
+        )
+
+    return waiting_times
@@ -0,0 +1,469 @@
+import os
+import sys
+import json
+import time
+import random
+import bisect
+import argparse
+import resource
+import datetime
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+from loguru import logger
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session, selectinload
+
+import common
+import local_day
+import scraper_main
+from models import Office, Snapshot, WaitingTime
+
+# Soak test for the scraper: runs scraper_main.run() against a local stub of the
+# city endpoint, with a clock that runs 100-1000x faster than real time, and
+# reports write throughput, DB growth, memory and whether the skip logic for
+# all-closed snapshots held.
+
+EXAMPLE_RESPONSE = Path(__file__).with_name("example_response.json")
+
+OPEN_STATUSES = [1, 2, 3, 4, 5, 6, 7, 8, 10]
+STATUS_NO_STAMPS_LEFT = 11
+
+
+class AcceleratedClock:
+    """
+    A clock that starts at `start` and runs `speed` times faster than real time.
+    Drop-in replacement for scraper_main.SystemClock.
+    """
+
+    def __init__(self, start: datetime.datetime, speed: float):
+        self.start = start
+        self.speed = speed
+        self.real_start = time.monotonic()
+
+    def now(self, tz=None) -> datetime.datetime:
+        elapsed = (time.monotonic() - self.real_start) * self.speed
+        virtual = self.start + datetime.timedelta(seconds=elapsed)
+        if tz is None:
+            # Naive local time, like datetime.now()
+            return virtual.astimezone().replace(tzinfo=None)
+        return virtual.astimezone(tz)
+
+    def sleep(self, seconds: float):
+        time.sleep(max(seconds, 0) / self.speed)
+
+
+class FixedClock:
+    """
+    A clock that is stopped at `now`, for evaluating time-based rules.
+    """
+
+    def __init__(self, now: datetime.datetime):
+        self.fixed_now = now
+
+    def now(self, tz=None) -> datetime.datetime:
+        return self.fixed_now
+
+
+class SyntheticFeed:
+    """
+    Payloads for the offices of example_response.json: open on weekdays from 8am
+    to 6pm local time, with a random walk of the waiting time and waiting stamps
+    running out in the afternoon.
+    """
+
+    def __init__(self, clock, seed: int = 0):
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.offices = json.loads(EXAMPLE_RESPONSE.read_text())
+        self.statuses = {office["id"]: 0 for office in self.offices}
+
+    def next_status(self, status: int, local_time: datetime.datetime) -> int:
+        if local_time.weekday() >= 5 or not 8 <= local_time.hour < 18:
+            return 0
+        if status == STATUS_NO_STAMPS_LEFT:
+            return status
+        if local_time.hour >= 14 and self.random.random() < 0.002:
+            return STATUS_NO_STAMPS_LEFT
+        if status == 0:
+            return OPEN_STATUSES[0]
+
+        index = OPEN_STATUSES.index(status) + self.random.choice((-1, 0, 0, 1))
+        return OPEN_STATUSES[min(max(index, 0), len(OPEN_STATUSES) - 1)]
+
+    def payload(self) -> list[dict]:
+        local_time = self.clock.now(local_day.LOCAL_TIMEZONE)
+        for office in self.offices:
+            status = self.next_status(self.statuses[office["id"]], local_time)
+            self.statuses[office["id"]] = status
+            office["status"] = status
+        return self.offices
+
+
+class RecordedFeed:
+    """
+    Replays a recording written by `replay_harness.py record`: returns the latest
+    recorded payload at the current virtual time.
+    """
+
+    def __init__(self, clock, recording: Path):
+        self.clock = clock
+        self.times = []
+        self.payloads = []
+        with open(recording) as f:
+            for line in f:
+                entry = json.loads(line)
+                self.times.append(datetime.datetime.fromisoformat(entry["captured_at"]))
+                self.payloads.append(entry["data"])
+
+    def payload(self) -> list[dict]:
+        index = bisect.bisect_right(self.times, self.clock.now(datetime.UTC)) - 1
+        return self.payloads[max(index, 0)]
+
+
+class StubStatusHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self.path.startswith("/bb/status"):
+            self.send_error(404)
+            return
+
+        body = json.dumps(self.server.feed.payload()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(feed) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Serve the feed on a free local port. Returns the server and the status URL.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStatusHandler)
+    server.feed = feed
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/bb/status?r="
+
+
+def get_rss_mb() -> float:
+    """
+    Current resident memory of this process, or the peak where /proc is missing.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SoakMonitor:
+    """
+    Checks every scraper iteration against the skip rules and reports throughput,
+    DB size and memory once per simulated day.
+    """
+
+    def __init__(self, clock, db_path: Path):
+        self.clock = clock
+        self.db_path = db_path
+        self.previous_all_closed = None
+        self.previous_minute = None
+        self.fetch_time = None
+        self.errors = []
+
+        self.fetched = 0
+        self.stored = 0
+        self.stored_rows = 0
+        self.missed_minutes = 0
+
+        self.day = None
+        self.day_stored = 0
+        self.day_rows = 0
+        self.day_real_start = time.perf_counter()
+        self.real_start = time.perf_counter()
+
+    def timed(self, fetch):
+        """
+        Wrap the fetch function to remember the virtual time of each fetch.
+        """
+
+        def timed_fetch():
+            self.fetch_time = self.clock.now()
+            return fetch()
+
+        return timed_fetch
+
+    def on_fetched(self, data: list[dict], stored: bool):
+        now = self.fetch_time
+        minute = now.replace(second=0, microsecond=0)
+        all_closed = scraper_main.all_offices_closed(data)
+
+        # Only all-closed snapshots following another all-closed one are skipped
+        expected = (
+            self.previous_all_closed is None
+            or self.previous_all_closed != all_closed
+            or not all_closed
+        )
+        if stored != expected:
+            self.errors.append(
+                f"{now}: stored={stored}, expected {expected} "
+                f"(all closed {self.previous_all_closed} -> {all_closed})"
+            )
+        self.previous_all_closed = all_closed
+
+        # Minutes skipped because the previous iteration took too long
+        if self.previous_minute is not None:
+            gap = round((minute - self.previous_minute).total_seconds() / 60)
+            next_minute = self.previous_minute + datetime.timedelta(minutes=1)
+            if gap > 1 and not scraper_main.it_is_nighttime(FixedClock(next_minute)):
+                self.missed_minutes += gap - 1
+        self.previous_minute = minute
+
+        if self.day is not None and now.date() != self.day:
+            self.report_day()
+        self.day = now.date()
+
+        self.fetched += 1
+        if stored:
+            self.stored += 1
+            self.stored_rows += len(data)
+            self.day_stored += 1
+            self.day_rows += len(data)
+
+    def report_day(self):
+        elapsed = time.perf_counter() - self.day_real_start
+        logger.info(
+            f"{self.day}: {self.day_stored} snapshots in {elapsed:.1f} s "
+            f"({self.day_rows / elapsed:.0f} rows/s), "
+            f"DB {self.db_path.stat().st_size / 2**20:.1f} MB, "
+            f"RSS {get_rss_mb():.0f} MB"
+        )
+        self.day_stored = 0
+        self.day_rows = 0
+        self.day_real_start = time.perf_counter()
+
+
+def check_db(engine, monitor: SoakMonitor) -> list[str]:
+    """
+    Compare the DB with what the monitor saw and check that no two consecutive
+    snapshots are both all closed.
+    """
+    errors = []
+
+    with Session(engine) as db:
+        snapshots = db.query(func.count(Snapshot.id)).scalar()
+        rows = db.query(func.count(WaitingTime.id)).scalar()
+        max_status = db.execute(
+            select(WaitingTime.snapshot_id, func.max(WaitingTime.status_id))
+            .group_by(WaitingTime.snapshot_id)
+            .order_by(WaitingTime.snapshot_id)
+        ).all()
+
+    if snapshots != monitor.stored:
+        errors.append(f"{snapshots} snapshots in DB, {monitor.stored} stored")
+    if rows != monitor.stored_rows:
+        errors.append(f"{rows} waiting times in DB, {monitor.stored_rows} stored")
+
+    all_closed = pd.Series([status == 0 for _, status in max_status])
+    repeated = int((all_closed & all_closed.shift(fill_value=False)).sum())
+    if repeated:
+        errors.append(f"{repeated} all-closed snapshots follow an all-closed one")
+
+    return errors
+
+
+def soak(feed_factory, start: datetime.datetime, days: float, speed: float, db_path):
+    """
+    Run the scraper against a stub server for `days` simulated days.
+    Returns True if all checks passed.
+    """
+    db_path.unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{db_path}")
+    scraper_main.setup_db_once(engine)
+
+    clock = AcceleratedClock(start, speed)
+    server, status_url = start_stub_server(feed_factory(clock))
+    monitor = SoakMonitor(clock, db_path)
+
+    logger.info(
+        f"Simulating {days} days from {start} at {speed}x speed "
+        f"(about {days * 86400 / speed / 60:.1f} min)..."
+    )
+
+    try:
+        scraper_main.run(
+            engine,
+            clock=clock,
+            fetch=monitor.timed(lambda: scraper_main.fetch_and_check_json(status_url)),
+            until=start + datetime.timedelta(days=days),
+            on_fetched=monitor.on_fetched,
+        )
+    finally:
+        server.shutdown()
+    monitor.report_day()
+
+    elapsed = time.perf_counter() - monitor.real_start
+    errors = monitor.errors + check_db(engine, monitor)
+
+    logger.info(
+        f"Fetched {monitor.fetched} and stored {monitor.stored} snapshots "
+        f"({monitor.stored_rows} waiting times) in {elapsed:.1f} s: "
+        f"{monitor.stored / elapsed:.1f} snapshots/s, "
+        f"{monitor.stored_rows / elapsed:.0f} rows/s."
+    )
+    logger.info(
+        f"DB size {db_path.stat().st_size / 2**20:.1f} MB, "
+        f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB, "
+        f"{monitor.missed_minutes} daytime minutes missed."
+    )
+
+    for error in errors[:20]:
+        logger.error(error)
+    if errors:
+        logger.error(f"{len(errors)} check(s) failed.")
+    else:
+        logger.info("All checks passed.")
+
+    return not errors
+
+
+def record(
+    engine, output: Path, start: datetime.date | None, end: datetime.date | None
+):
+    """
+    Write the snapshots of the DB as a recording for RecordedFeed, one JSON
+    object with captured_at and the payload per line.
+    """
+    with Session(engine) as db:
+        offices = {
+            office.id: office
+            for office in db.query(Office).options(selectinload(Office.features))
+        }
+
+        query = (
+            select(Snapshot.captured_at, WaitingTime.office_id, WaitingTime.status_id)
+            .join(WaitingTime, Snapshot.id == WaitingTime.snapshot_id)
+            .order_by(Snapshot.id, WaitingTime.office_id)
+        )
+        if start:
+            query = query.filter(Snapshot.local_date >= start)
+        if end:
+            query = query.filter(Snapshot.local_date <= end)
+
+        count = 0
+        with open(output, "w") as f:
+            df = pd.DataFrame(
+                db.execute(query).all(),
+                columns=["captured_at", "office_id", "status_id"],
+            )
+            for captured_at, snapshot in df.groupby("captured_at", sort=False):
+                data = [
+                    {
+                        "id": office_id,
+                        "label": offices[office_id].label,
+                        "status": status_id,
+                        "url": offices[office_id].url,
+                        "features": [f.name for f in offices[office_id].features],
+                    }
+                    for office_id, status_id in zip(
+                        snapshot["office_id"].tolist(), snapshot["status_id"].tolist()
+                    )
+                ]
+                captured_at = captured_at.replace(tzinfo=datetime.UTC)
+                entry = {"captured_at": captured_at.isoformat(), "data": data}
+                f.write(json.dumps(entry) + "\n")
+                count += 1
+
+    logger.info(f"Recorded {count} snapshots to {output}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Soak-test the scraper against a local stub at accelerated speed."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    synthetic = subparsers.add_parser("synthetic", help="replay synthetic payloads")
+    synthetic.add_argument(
+        "--start",
+        type=datetime.date.fromisoformat,
+        default=datetime.date(2025, 1, 6),
+        help="first simulated day (default: 2025-01-06)",
+    )
+    synthetic.add_argument("--seed", type=int, default=0)
+
+    replay = subparsers.add_parser("replay", help="replay a recording")
+    replay.add_argument("recording", type=Path)
+
+    for subparser in (synthetic, replay):
+        subparser.add_argument(
+            "--days", type=float, default=7, help="simulated days (default: 7)"
+        )
+        subparser.add_argument(
+            "--speed", type=float, default=1000, help="clock speed (default: 1000x)"
+        )
+        subparser.add_argument(
+            "--db",
+            type=Path,
+            default=Path("data/replay.sqlite"),
+            help="scratch DB, deleted first (default: data/replay.sqlite)",
+        )
+
+    recorder = subparsers.add_parser(
+        "record", help="write a recording from the waiting times DB"
+    )
+    recorder.add_argument("output", type=Path)
+    recorder.add_argument("--start", type=datetime.date.fromisoformat)
+    recorder.add_argument("--end", type=datetime.date.fromisoformat)
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        engine = create_engine(common.get_db_path())
+        local_day.migrate_local_day(engine)
+        record(engine, args.output, args.start, args.end)
+        return
+
+    args.db.parent.mkdir(parents=True, exist_ok=True)
+
+    if args.command == "synthetic":
+        start = datetime.datetime.combine(
+            args.start, datetime.time(), local_day.LOCAL_TIMEZONE
+        )
+        passed = soak(
+            lambda clock: SyntheticFeed(clock, args.seed),
+            start,
+            args.days,
+            args.speed,
+            args.db,
+        )
+    else:
+        with open(args.recording) as f:
+            first = json.loads(f.readline())
+        start = datetime.datetime.fromisoformat(first["captured_at"])
+        passed = soak(
+            lambda clock: RecordedFeed(clock, args.recording),
+            start,
+            args.days,
+            args.speed,
+            args.db,
+        )
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    is_debug = os.getenv("DEBUG", "0") == "1" or os.getenv("DEBUG", "0") == "true"
+    loglevel = "DEBUG" if is_debug else "INFO"
+
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    main()
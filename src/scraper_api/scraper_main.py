@@ -4,12 +4,13 @@ import time
 import json
 import common
 import random
+import local_day
 import requests
 import datetime
 from loguru import logger
 from pathlib import Path
 from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from models import Base, Status, Feature, Office, WaitingTime, Snapshot
 
 
@@ -29,8 +30,23 @@ STATUS_VALUES = [
 ]
 
 
-def fetch_and_check_json() -> list[dict]:
-    url = f"{STATUS_URL}{random.randint(1000000000, 9999999999)}"
+class SystemClock:
+    """
+    The wall clock. The replay harness swaps in an accelerated clock.
+    """
+
+    def now(self, tz=None) -> datetime.datetime:
+        return datetime.datetime.now(tz)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+def fetch_and_check_json(status_url: str = STATUS_URL) -> list[dict]:
+    url = f"{status_url}{random.randint(1000000000, 9999999999)}"
     resp = requests.get(url)
     if resp.status_code != 200:
         logger.error(f"Failed to fetch data from {url}: {resp.status_code}")
@@ -53,15 +69,16 @@ def fetch_and_check_json() -> list[dict]:
     return data
 
 
-def wait_for_next_minute():
-    now = datetime.datetime.now()
+def wait_for_next_minute(clock=SYSTEM_CLOCK):
+    now = clock.now()
     next_minute = (now + datetime.timedelta(minutes=1)).replace(second=0, microsecond=0)
     sleep_time = (next_minute - now).total_seconds()
-    time.sleep(sleep_time)
+    clock.sleep(sleep_time)
 
 
 def setup_db_once(engine):
     Base.metadata.create_all(engine)
+    local_day.migrate_local_day(engine)
 
     with Session(engine) as db:
         if db.get(Status, 1) is None:  # bootstrap only once
@@ -71,9 +88,25 @@ def setup_db_once(engine):
             db.commit()
 
 
-def insert_data(db, data: list[dict]):
+def mark_catalog_changed(path: Path):
+    """
+    Tell the API to reload its cached office catalog.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(str(time.time_ns()))
+
+
+def insert_data(
+    db,
+    data: list[dict],
+    captured_at: datetime.datetime | None = None,
+    catalog_version_path: Path | None = None,
+):
     feature_cache: dict[str, Feature] = {f.name: f for f in db.query(Feature).all()}
-    office_cache: dict[int, Office] = {o.id: o for o in db.query(Office).all()}
+    office_cache: dict[int, Office] = {
+        o.id: o for o in db.query(Office).options(selectinload(Office.features))
+    }
+    catalog_changed = False
 
     for entry in data:
         office = office_cache.get(entry["id"])
@@ -85,23 +118,32 @@ def insert_data(db, data: list[dict]):
             )
             db.add(office)
             office_cache[office.id] = office
-        else:
+            catalog_changed = True
+        elif office.label != entry["label"] or office.url != entry["url"]:
             # update name or URL if they changed
             office.label = entry["label"]
             office.url = entry["url"]
-
-        # features
-        office.features.clear()
-        for feat in entry["features"]:
-            obj = feature_cache.get(feat)
-            if obj is None:
-                obj = Feature(name=feat)
-                db.add(obj)
-                feature_cache[feat] = obj
-            office.features.append(obj)
+            catalog_changed = True
+
+        # features, only rewritten if they changed
+        if {f.name for f in office.features} != set(entry["features"]):
+            office.features.clear()
+            for feat in entry["features"]:
+                obj = feature_cache.get(feat)
+                if obj is None:
+                    obj = Feature(name=feat)
+                    db.add(obj)
+                    feature_cache[feat] = obj
+                office.features.append(obj)
+            catalog_changed = True
 
     # create snapshot + waiting-time rows
-    snap = Snapshot()
+    if captured_at is None:
+        captured_at = datetime.datetime.now(datetime.UTC)
+    local_date, local_minute = local_day.to_local_day(captured_at)
+    snap = Snapshot(
+        captured_at=captured_at, local_date=local_date, local_minute=local_minute
+    )
     db.add(snap)
     db.flush()  # gives snap.id
 
@@ -116,35 +158,50 @@ def insert_data(db, data: list[dict]):
 
     db.commit()
 
+    if catalog_changed and catalog_version_path is not None:
+        mark_catalog_changed(catalog_version_path)
+
 
 def all_offices_closed(data):
     return all(entry["status"] == 0 for entry in data)
 
 
-def it_is_nighttime():
-    now = datetime.datetime.now()
+def it_is_nighttime(clock=SYSTEM_CLOCK):
+    now = clock.now()
     return now.hour < 5 or now.hour > 22
 
 
-def main():
-    logger.info("Starting waiting time scraper...")
-    data_dir = Path("data")
-    data_dir.mkdir(parents=True, exist_ok=True)
-    engine = create_engine(common.get_db_path())
-    setup_db_once(engine)
-    logger.debug("Database setup completed.")
-
+def run(
+    engine,
+    clock=SYSTEM_CLOCK,
+    fetch=fetch_and_check_json,
+    until: datetime.datetime | None = None,
+    on_fetched=None,
+    catalog_version_path: Path | None = None,
+):
+    """
+    Scrape once per minute until `until` (forever by default).
+
+    Args:
+        engine: SQLAlchemy engine of the waiting times DB
+        clock: provides now() and sleep(), see SystemClock
+        fetch: returns the current office data
+        until: timezone-aware end time
+        on_fetched: called with the fetched data and whether it was stored
+        catalog_version_path: file touched when office metadata changes, see
+            common.get_catalog_version_path(); None to not notify the API
+    """
     previous_all_closed = None
 
-    while True:
-        wait_for_next_minute()
+    while until is None or clock.now(datetime.UTC) < until:
+        wait_for_next_minute(clock)
 
-        if it_is_nighttime():
+        if it_is_nighttime(clock):
             logger.debug("It's nighttime, skipping data ingestion.")
             continue
 
         try:
-            data = fetch_and_check_json()
+            data = fetch()
             current_all_closed = all_offices_closed(data)
 
             should_store = False
@@ -159,18 +216,32 @@ def main():
 
             if should_store:
                 with Session(engine) as db:
-                    insert_data(db, data)
+                    insert_data(db, data, clock.now(datetime.UTC), catalog_version_path)
                 logger.debug("Data ingestion completed.")
 
             # Update previous state
             previous_all_closed = current_all_closed
 
+            if on_fetched is not None:
+                on_fetched(data, should_store)
+
         except Exception as e:
             logger.error(f"Error during data ingestion: {e}")
 
         logger.debug("Waiting for the next minute...")
 
 
+def main():
+    logger.info("Starting waiting time scraper...")
+    data_dir = Path("data")
+    data_dir.mkdir(parents=True, exist_ok=True)
+    engine = create_engine(common.get_db_path())
+    setup_db_once(engine)
+    logger.debug("Database setup completed.")
+
+    run(engine, catalog_version_path=common.get_catalog_version_path())
+
+
 if __name__ == "__main__":
     is_debug = os.getenv("DEBUG", "0") == "1" or os.getenv("DEBUG", "0") == "true"
     loglevel = "DEBUG" if is_debug else "INFO"
@@ -0,0 +1,304 @@
+import os
+import json
+import shutil
+import threading
+import datetime as dt
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import columnar_cache
+from models import Office
+
+# Dense, memory-mapped store of all waiting times: per local (Europe/Berlin) day
+# one int8 matrix of offices x minutes of the day, plus the capture time and
+# snapshot id of every minute. Reads slice these arrays instead of querying the
+# DB.
+#
+# Layout of the cube directory:
+#   meta.json                   cube version, id of the last loaded waiting_time row
+#   offices.npy                 office id of each matrix row
+#   YYYY-MM-DD/status.npy       int8 [offices, minutes], -1 where no sample
+#   YYYY-MM-DD/captured_at.npy  int64 [minutes], microseconds since the epoch
+#   YYYY-MM-DD/snapshot_id.npy  int64 [minutes], 0 where no snapshot
+
+# Bump when the layout changes, the cube is then rebuilt from the DB
+CUBE_VERSION = 2
+
+MINUTES_PER_DAY = 24 * 60
+
+NO_STATUS = -1
+
+# Days kept memory-mapped. Each day holds three file descriptors, older days are
+# unmapped and mapped again when they are read.
+MAX_OPEN_DAYS = 8
+
+
+class DayArrays:
+    def __init__(self, day_dir: Path, office_count: int):
+        self.day_dir = day_dir
+        # snapshot_id.npy is created last, a day without it is incomplete
+        if (day_dir / "snapshot_id.npy").exists():
+            self.status = np.lib.format.open_memmap(day_dir / "status.npy", "r+")
+            self.captured_at = np.lib.format.open_memmap(
+                day_dir / "captured_at.npy", "r+"
+            )
+            self.snapshot_id = np.lib.format.open_memmap(
+                day_dir / "snapshot_id.npy", "r+"
+            )
+        else:
+            day_dir.mkdir(parents=True, exist_ok=True)
+            self.status = self.create_status(office_count)
+            self.captured_at = self.create(
+                "captured_at.npy", np.int64, (MINUTES_PER_DAY,)
+            )
+            self.snapshot_id = self.create(
+                "snapshot_id.npy", np.int64, (MINUTES_PER_DAY,)
+            )
+
+    def create(self, name: str, dtype, shape: tuple, fill_value=0) -> np.memmap:
+        tmp_path = self.day_dir / f".{name}.tmp"
+        array = np.lib.format.open_memmap(tmp_path, "w+", dtype=dtype, shape=shape)
+        array[:] = fill_value
+        array.flush()
+        os.replace(tmp_path, self.day_dir / name)
+        return array
+
+    def create_status(self, office_count: int) -> np.memmap:
+        return self.create(
+            "status.npy", np.int8, (office_count, MINUTES_PER_DAY), NO_STATUS
+        )
+
+    def ensure_office_count(self, office_count: int):
+        """
+        Grow the status matrix when offices were added after the day was created.
+        """
+        old_status = self.status
+        if old_status.shape[0] >= office_count:
+            return
+        status = self.create_status(office_count)
+        status[: old_status.shape[0]] = old_status
+        status.flush()
+        self.status = status
+        # Unmap the replaced file
+        del old_status
+
+    def flush(self):
+        self.status.flush()
+        self.captured_at.flush()
+        self.snapshot_id.flush()
+
+    def close(self):
+        """
+        Flush and unmap the arrays. Their file descriptors are released once the
+        last reference is gone; reads only ever keep copies.
+        """
+        self.flush()
+        del self.status, self.captured_at, self.snapshot_id
+
+
+def format_timestamps(captured_at: np.ndarray) -> list[str]:
+    """
+    Format microsecond timestamps like datetime.isoformat() formats naive UTC
+    datetimes, i.e. without fractional seconds if they are zero.
+    """
+    timestamps = captured_at.astype("datetime64[us]")
+    return np.where(
+        captured_at % 10**6 == 0,
+        np.datetime_as_string(timestamps, unit="s"),
+        np.datetime_as_string(timestamps, unit="us"),
+    ).tolist()
+
+
+class StatusCube:
+    """
+    The waiting times of all offices, indexed by local day and minute of the day.
+    """
+
+    def __init__(self, cube_dir: Path):
+        self.cube_dir = cube_dir
+        self.cube_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # Most recently used last
+        self.days: OrderedDict[dt.date, DayArrays] = OrderedDict()
+
+        try:
+            meta = json.loads((cube_dir / "meta.json").read_text())
+        except FileNotFoundError:
+            meta = {}
+
+        if meta.get("version") == CUBE_VERSION:
+            self.last_id = meta["last_id"]
+            self.office_ids = np.load(cube_dir / "offices.npy").tolist()
+        else:
+            # Missing or outdated, start over
+            for day_dir in cube_dir.iterdir():
+                if day_dir.is_dir():
+                    shutil.rmtree(day_dir)
+            self.last_id = 0
+            self.office_ids = []
+
+        self.office_rows = {office_id: i for i, office_id in enumerate(self.office_ids)}
+        # Matrix rows ordered by office label, filled by refresh()
+        self.label_order: list[tuple[int, int]] = []
+
+    def get_day_arrays(self, day: dt.date, create: bool = False) -> DayArrays | None:
+        arrays = self.days.get(day)
+        if arrays is not None:
+            self.days.move_to_end(day)
+            return arrays
+
+        day_dir = self.cube_dir / day.isoformat()
+        if not create and not (day_dir / "snapshot_id.npy").exists():
+            return None
+        arrays = DayArrays(day_dir, len(self.office_ids))
+        self.days[day] = arrays
+
+        while len(self.days) > MAX_OPEN_DAYS:
+            _, evicted = self.days.popitem(last=False)
+            evicted.close()
+        return arrays
+
+    def write_meta(self):
+        tmp_path = self.cube_dir / ".offices.npy.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.array(self.office_ids, dtype=np.int32))
+        os.replace(tmp_path, self.cube_dir / "offices.npy")
+
+        tmp_path = self.cube_dir / ".meta.json.tmp"
+        tmp_path.write_text(
+            json.dumps({"version": CUBE_VERSION, "last_id": self.last_id})
+        )
+        os.replace(tmp_path, self.cube_dir / "meta.json")
+
+    def refresh(self, session: Session) -> int:
+        """
+        Load all waiting times added to the DB since the last refresh. Returns the
+        number of loaded rows.
+        """
+        rows = columnar_cache.fetch_rows_after(session, self.last_id)
+        offices = session.query(Office.id, Office.label).all()
+
+        with self.lock:
+            for office_id in np.unique(rows.office_id).tolist():
+                if office_id not in self.office_rows:
+                    self.office_rows[office_id] = len(self.office_ids)
+                    self.office_ids.append(office_id)
+
+            self.label_order = [
+                (office_id, self.office_rows[office_id])
+                for office_id, _ in sorted(offices, key=lambda office: office[1])
+                if office_id in self.office_rows
+            ]
+
+            if not len(rows):
+                return 0
+
+            office_lookup = np.full(max(self.office_ids) + 1, -1, dtype=np.int32)
+            office_lookup[self.office_ids] = np.arange(len(self.office_ids))
+
+            minute = rows.local_minute
+            row = office_lookup[rows.office_id]
+
+            for day_number in np.unique(rows.local_date).tolist():
+                day = dt.date(1970, 1, 1) + dt.timedelta(days=day_number)
+                arrays = self.get_day_arrays(day, create=True)
+                arrays.ensure_office_count(len(self.office_ids))
+
+                in_day = rows.local_date == day_number
+                arrays.status[row[in_day], minute[in_day]] = rows.status_id[in_day]
+                arrays.captured_at[minute[in_day]] = rows.captured_at[in_day]
+                # Written last, marks the minute as present
+                arrays.snapshot_id[minute[in_day]] = rows.snapshot_id[in_day]
+                arrays.flush()
+
+            self.last_id = rows.last_id
+            self.write_meta()
+
+        return len(rows)
+
+    def get_office_series(
+        self, arrays: DayArrays, row: int, minutes: np.ndarray, timestamps: list[str]
+    ) -> list[dict]:
+        if row >= arrays.status.shape[0]:
+            return []
+
+        statuses = arrays.status[row, minutes].tolist()
+        return [
+            {"captured_at": captured_at, "status_id": status_id}
+            for captured_at, status_id in zip(timestamps, statuses)
+            if status_id != NO_STATUS
+        ]
+
+    def get_day(self, day: dt.date) -> dict[int, list[dict]]:
+        """
+        Return a dict that maps office ids to their waiting times over the given day.
+        """
+        with self.lock:
+            arrays = self.get_day_arrays(day)
+            if arrays is None:
+                return {}
+
+            minutes = np.flatnonzero(arrays.snapshot_id)
+            timestamps = format_timestamps(arrays.captured_at[minutes])
+
+            waiting_times = {}
+            for office_id, row in self.label_order:
+                series = self.get_office_series(arrays, row, minutes, timestamps)
+                if series:
+                    waiting_times[office_id] = series
+
+            return waiting_times
+
+    def get_office_range(
+        self, office_id: int, start: dt.date, end: dt.date
+    ) -> list[dict]:
+        """
+        Return the waiting times of one office from start to end (inclusive).
+        """
+        waiting_times = []
+
+        with self.lock:
+            row = self.office_rows.get(office_id)
+            if row is None:
+                return []
+
+            day = start
+            while day <= end:
+                arrays = self.get_day_arrays(day)
+                if arrays is not None:
+                    minutes = np.flatnonzero(arrays.snapshot_id)
+                    timestamps = format_timestamps(arrays.captured_at[minutes])
+                    waiting_times += self.get_office_series(
+                        arrays, row, minutes, timestamps
+                    )
+                day += dt.timedelta(days=1)
+
+        return waiting_times
+
+    def get_office_updates(
+        self, office_id: int, day: dt.date, since_snapshot: int
+    ) -> tuple[list[dict], int]:
+        """
+        Return the waiting times of one office on the given day from snapshots
+        newer than since_snapshot, and the newest snapshot id of that day as the
+        cursor for the next call.
+        """
+        with self.lock:
+            arrays = self.get_day_arrays(day)
+            if arrays is None:
+                return [], since_snapshot
+
+            minutes = np.flatnonzero(arrays.snapshot_id > since_snapshot)
+            if not len(minutes):
+                return [], since_snapshot
+            cursor = int(arrays.snapshot_id[minutes].max())
+
+            row = self.office_rows.get(office_id)
+            if row is None:
+                return [], cursor
+
+            timestamps = format_timestamps(arrays.captured_at[minutes])
+            return self.get_office_series(arrays, row, minutes, timestamps), cursor
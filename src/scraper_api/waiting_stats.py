@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import pandas as pd
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import common
+import local_day
+import columnar_cache
+from models import Office
+
+# Statistics over the full waiting time history, computed with vectorized
+# pandas operations on the memory-mapped columnar cache (see columnar_cache.py)
+
+STATUS_CLOSED = 0
+STATUS_NO_STAMPS_LEFT = 11
+# Status codes that describe an actual waiting time ("< 30 min" to "> 120 min")
+OPEN_STATUSES = range(1, 11)
+
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.95)
+
+# Robust z-score above which a day is flagged as anomalous
+ANOMALY_THRESHOLD = 3.5
+
+
+def to_frame(columns: columnar_cache.WaitingTimeColumns) -> pd.DataFrame:
+    """
+    Build a DataFrame with local-time calendar columns from the cached columns.
+    """
+    captured_at = pd.to_datetime(columns.captured_at, unit="us", utc=True)
+    local_time = captured_at.tz_convert(common.LOCAL_TIMEZONE).tz_localize(None)
+    date = pd.to_datetime(columns.local_date, unit="D")
+
+    return pd.DataFrame(
+        {
+            "snapshot_id": columns.snapshot_id,
+            "office_id": columns.office_id,
+            "status_id": columns.status_id,
+            "local_time": local_time,
+            "date": date,
+            "weekday": date.weekday,
+            "hour": columns.local_minute // 60,
+            "minute_of_day": columns.local_minute,
+        }
+    )
+
+
+def load_frame(engine) -> pd.DataFrame:
+    return to_frame(columnar_cache.load_waiting_times(engine))
+
+
+def status_distribution(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Share of each status per office, weekday and hour. One column per status id.
+    """
+    counts = (
+        df.groupby(["office_id", "weekday", "hour", "status_id"])
+        .size()
+        .unstack(fill_value=0)
+    )
+    shares = counts.div(counts.sum(axis=1), axis=0)
+    shares["samples"] = counts.sum(axis=1)
+    return shares
+
+
+def status_percentiles(
+    df: pd.DataFrame, percentiles=DEFAULT_PERCENTILES
+) -> pd.DataFrame:
+    """
+    Percentiles of the waiting time status per office, weekday and hour, only
+    counting samples with an actual waiting time. Status codes are ordinal, so
+    the percentiles are always existing status codes.
+    """
+    open_df = df[df["status_id"].isin(OPEN_STATUSES)]
+    grouped = open_df.groupby(["office_id", "weekday", "hour"])["status_id"]
+
+    return pd.concat(
+        {
+            f"p{round(q * 100)}": grouped.quantile(q, interpolation="lower")
+            for q in percentiles
+        },
+        axis=1,
+    ).astype("int8")
+
+
+def robust_zscore(values: pd.Series, groups: list[pd.Series]) -> pd.Series:
+    """
+    Robust z-score (based on median and MAD) of each value within its group.
+    """
+    median = values.groupby(groups).transform("median")
+    deviation = (values - median).abs()
+    mad = deviation.groupby(groups).transform("median")
+    return 0.6745 * (values - median) / mad.where(mad > 0)
+
+
+def daily_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per office and day: mean status, day-over-day delta, the time when the
+    waiting stamps ran out and anomaly flags compared to the same weekday.
+    """
+    grouped = df.groupby(["office_id", "date"])
+
+    open_status = df["status_id"].where(df["status_id"].isin(OPEN_STATUSES))
+    exhausted_minute = df["minute_of_day"].where(
+        df["status_id"] == STATUS_NO_STAMPS_LEFT
+    )
+
+    daily = pd.DataFrame(
+        {
+            "mean_status": open_status.groupby([df["office_id"], df["date"]]).mean(),
+            "open_samples": open_status.groupby([df["office_id"], df["date"]]).count(),
+            "exhausted_minute": exhausted_minute.groupby(
+                [df["office_id"], df["date"]]
+            ).min(),
+            "samples": grouped.size(),
+        }
+    )
+
+    daily["mean_status_delta"] = daily.groupby(level="office_id")["mean_status"].diff()
+
+    office_id = daily.index.get_level_values("office_id").to_series(index=daily.index)
+    weekday = daily.index.get_level_values("date").weekday.to_series(index=daily.index)
+    daily["mean_status_zscore"] = robust_zscore(
+        daily["mean_status"], [office_id, weekday]
+    )
+    daily["exhausted_zscore"] = robust_zscore(
+        daily["exhausted_minute"], [office_id, weekday]
+    )
+    daily["anomaly"] = (daily["mean_status_zscore"].abs() > ANOMALY_THRESHOLD) | (
+        daily["exhausted_zscore"].abs() > ANOMALY_THRESHOLD
+    )
+
+    return daily
+
+
+def compute_report(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    return {
+        "status_distribution": status_distribution(df),
+        "status_percentiles": status_percentiles(df),
+        "daily_summary": daily_summary(df),
+    }
+
+
+def write_report(
+    report: dict[str, pd.DataFrame], output_dir: Path, office_labels: dict[int, str]
+):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name, table in report.items():
+        table = table.reset_index()
+        table.insert(1, "office", table["office_id"].map(office_labels))
+        table.to_csv(output_dir / f"{name}.csv", index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute waiting time statistics over the full history."
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("data/reports"),
+        help="directory for the CSV reports (default: data/reports)",
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(common.get_db_path())
+    local_day.migrate_local_day(engine)
+
+    start = time.perf_counter()
+    df = load_frame(engine)
+    logger.info(f"Loaded {len(df)} samples in {time.perf_counter() - start:.2f} s.")
+
+    if df.empty:
+        logger.warning("No waiting times in the database.")
+        return
+
+    start = time.perf_counter()
+    report = compute_report(df)
+    logger.info(f"Computed statistics in {time.perf_counter() - start:.2f} s.")
+
+    with Session(engine) as db:
+        office_labels = dict(db.query(Office.id, Office.label).all())
+
+    write_report(report, args.output, office_labels)
+    logger.info(f"Reports written to {args.output}.")
+
+    daily = report["daily_summary"]
+    for (office_id, date), row in daily[daily["anomaly"]].iterrows():
+        logger.info(
+            f"Anomaly: {office_labels.get(office_id, office_id)} on {date:%Y-%m-%d} "
+            f"(mean status {row['mean_status']:.2f}, "
+            f"z-score {row['mean_status_zscore']:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    is_debug = os.getenv("DEBUG", "0") == "1" or os.getenv("DEBUG", "0") == "true"
+    loglevel = "DEBUG" if is_debug else "INFO"
+
+    logger.remove()
+    logger.add(sys.stderr, level=loglevel)
+
+    main()